@@ -2,13 +2,17 @@
 # coding: utf-8
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 syn=python
 
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from math import nan
 import json
 import re
 from subprocess import run
 from tempfile import mkdtemp
-from os import listdir, unlink, removedirs
+from textwrap import indent
+from os import cpu_count
 from os.path import join as pjoin
+from shutil import rmtree
 from time import monotonic
 import logging
 import argparse
@@ -18,6 +22,36 @@ import fitsio
 
 logger = logging.getLogger(__file__)
 
+try:
+    import orjson
+
+    def _dumps(o) -> str:
+        return orjson.dumps(o, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+except ImportError:
+
+    def _dumps(o) -> str:
+        return json.dumps(o, sort_keys=True, indent=2, ensure_ascii=False)
+
+
+_RE_FOV = re.compile(r"Field size: ([0-9.]+) x ([0-9.]+)")
+_RE_CENTER = re.compile(r"Field center: \(RA,Dec\) = \(([0-9.-]+), ([0-9.-]+)\) deg.")
+_RE_SCALE = re.compile(r"pixel scale ([0-9.]+) arcsec/pix")
+_RE_CONST = re.compile(r"[Tt]he constellation (.+)")
+_RE_STAR = re.compile(r"The star (.+)")
+_RE_IC = re.compile(r"(IC \d+.*)")
+_RE_NGC = re.compile(r"(NGC \d+.*)")
+_RE_INDEX = re.compile(r"Field \d+: solved with index index-([a-z0-9-]+).\S+endian.fits.")
+_RE_SOURCES = re.compile(r"simplexy: found (\d+) sources")
+
+# Converters for the single-valued fields, given the capture groups of their pattern
+_SCALAR_FIELDS = {
+    "fov": lambda g: [float(g[0]), float(g[1])],
+    "field_center": lambda g: {"ra": float(g[0]), "dec": float(g[1])},
+    "arcsec_pp": lambda g: float(g[0]),
+    "index": lambda g: g[0],
+    "sources": lambda g: int(g[0]),
+}
 
 def get_args() -> argparse.Namespace:
     ap = argparse.ArgumentParser(description="identify an image by plate solving")
@@ -30,37 +64,55 @@ def get_args() -> argparse.Namespace:
     ap.add_argument("-H", "--scale-high", type=float, default=2)
     ap.add_argument("--test-file", default=False, action="store_true")
     ap.add_argument("--save-temps", default=False, action="store_true")
+    ap.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="solve-field instances to run at once, each loads its own index files [number of CPUs]",
+    )
     ap.add_argument(nargs="+", dest="files")
     return ap.parse_args()
 
 
 def rm_rf(d):
-    # I should rewrite this to either be recursive or use os.walk
-    for f in listdir(d):
-        try:
-            unlink(pjoin(d, f))
-        except (OSError, IOError):
-            pass
-    try:
-        removedirs(d)
-    except (OSError, IOError):
-        pass
+    rmtree(d, ignore_errors=True)
+
+
+def _flagify(k: str, v: Any) -> tuple:
+    "turn a solve_image kwarg into solve-field arguments"
+    k = k.replace("_", "-")
+    d = "-" if len(k) == 1 else "--"
+    return (d + k,) if v is True else (d + k, str(v))
 
 
 def parse_buf(b: str) -> Dict[str, Any]:
-    rv = dict()
-    rv["fov"] = [float(x) for x in re.search(r"Field size: ([0-9.]+) x ([0-9.]+)", b).groups()]
-    tmp = re.search(r"Field center: \(RA,Dec\) = \(([0-9.-]+), ([0-9.-]+)\) deg.", b).groups()
-    rv["field_center"] = dict(zip(["ra", "dec"], [float(x) for x in tmp]))
-    rv["arcsec_pp"] = float(re.search(r"pixel scale ([0-9.]+) arcsec/pix", b).group(1))
-    rv["constellations"] = re.findall(r"[Tt]he constellation (.+)", b)
-    rv["stars"] = re.findall(r"The star (.+)", b)
-    rv["ic"] = re.findall(r"(IC \d+.*)", b)
-    rv["ngc"] = re.findall(r"(NGC \d+.*)", b)
-    try:
-        rv["index"] = re.search(r"Field \d+: solved with index index-([a-z0-9-]+).\S+endian.fits.", b).group(1)
-    except AttributeError:
-        pass
+    if "Did not solve" in b:
+        # nothing else worth looking for
+        rv = {"solved": False}
+        m = _RE_SOURCES.search(b)
+        if m:
+            rv["sources"] = int(m.group(1))
+        return rv
+
+    rv = {"solved": True}
+    for k, pat in (("fov", _RE_FOV), ("field_center", _RE_CENTER), ("arcsec_pp", _RE_SCALE)):
+        m = pat.search(b)
+        if m is None:
+            # no solution in this output after all
+            rv["solved"] = False
+            return rv
+        rv[k] = _SCALAR_FIELDS[k](m.groups())
+    for k, pat in (("index", _RE_INDEX), ("sources", _RE_SOURCES)):
+        m = pat.search(b)
+        if m:
+            rv[k] = _SCALAR_FIELDS[k](m.groups())
+
+    # skip the regex entirely when the literal it needs isn't there. findall beats a
+    # [m.group(1) for m in finditer()] comprehension here: it builds the strings in C
+    rv["constellations"] = _RE_CONST.findall(b) if "constellation" in b else []
+    rv["stars"] = _RE_STAR.findall(b) if "The star" in b else []
+    rv["ic"] = _RE_IC.findall(b) if "IC " in b else []
+    rv["ngc"] = _RE_NGC.findall(b) if "NGC " in b else []
     return rv
 
 
@@ -88,16 +140,12 @@ def solve_image(img: str, save_temps: bool = False, solver_debug: bool = False,
     solver_args = ["solve-field", "--dir", wd, "--temp-dir", wd]
 
     for k, v in kwargs.items():
-        k = k.replace("_", "-")
-        d = "-" if len(k) == 1 else "--"
-        if v is True:
-            solver_args.append(d + k)
-        else:
-            solver_args.extend([d + k, str(v)])
+        solver_args.extend(_flagify(k, v))
 
     solver_args.append(img)
     try:
-        fits_header = dict(fitsio.read_header(img))
+        h = fitsio.read_header(img)
+        fits_header = {k: h[k] for k in ("RA", "DEC", "OBJECT", "NAXIS1", "NAXIS2", "SECPIX1", "SECPIX2") if k in h}
     except OSError:
         fits_header = dict()
 
@@ -112,9 +160,8 @@ def solve_image(img: str, save_temps: bool = False, solver_debug: bool = False,
         rm_rf(wd)
 
     if solver_debug:
-        print("\n\n\n", solver_out, "\n\n\n")
+        print("\n\n\n", solver_out, "\n\n\n", file=stderr)
 
-    m = re.search("simplexy: found (\d+) sources", solver_out)
     rv = {
         "file": img,
         "solve_time": round(t2 - t1, 3),
@@ -136,17 +183,27 @@ def solve_image(img: str, save_temps: bool = False, solver_debug: bool = False,
     except KeyError:
         pass
 
-    if m:
-        rv["sources"] = int(m.group(1))
-
-    if "Did not solve" in solver_out:
-        logging.warning(f"Unable to solve {img}")
+    parsed = parse_buf(solver_out)
+    if parsed["solved"]:
+        rv.update(parsed)
     else:
-        rv["solved"] = True
-        rv.update(parse_buf(solver_out))
+        logging.warning(f"Unable to solve {img}")
+        if "sources" in parsed:
+            rv["sources"] = parsed["sources"]
     return rv
 
 
+def _solve_one(f: str, args: argparse.Namespace) -> Dict[str, Any]:
+    if args.test_file:
+        with open(f) as ifd:
+            solve_res = parse_buf(ifd.read())
+            solve_res["file"] = f
+            solve_res["solve_time"] = 0.0
+    else:
+        solve_res = solve_image(f, save_temps=args.save_temps, solver_debug=args.verbose > 2, guess_scale=True)
+    return solve_res
+
+
 def main():
     args = get_args()
     lvl = logging.WARNING
@@ -154,26 +211,28 @@ def main():
         lvl = logging.DEBUG if args.verbose > 1 else logging.INFO
     logger.setLevel(lvl)
     logging.basicConfig()
-    solver_results = []
-
-    for f in args.files:
-        solve_res = dict()
-        if args.test_file:
-            with open(f) as ifd:
-                solve_res = parse_buf(ifd.read())
-                solve_res["file"] = f
-                solve_res["solve_time"] = 0.0
-        else:
-            solve_res = solve_image(f, save_temps=args.save_temps, solver_debug=args.verbose > 2, guess_scale=True)
-
-        if args.verbose:
-            logger.info(solve_res)
-
-        if solve_res["solved"] or args.verbose > 1:
-            solver_results.append(solve_res)
-
-    with open(args.output, "w") as ofd:
-        json.dump(solver_results, ofd, sort_keys=True, indent=2)
+
+    # solve-field only uses one core, so run one per file in parallel.
+    # write each result out as soon as it's available instead of collecting them all
+    nproc = min(len(args.files), args.jobs or cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=nproc) as ex, open(args.output, "w", encoding="utf-8") as ofd:
+        ofd.write("[")
+        sep = "\n"
+        try:
+            for solve_res in ex.map(partial(_solve_one, args=args), args.files):
+                if args.verbose:
+                    logger.info(solve_res)
+
+                if solve_res["solved"] or args.verbose > 1:
+                    ofd.write(sep + indent(_dumps(solve_res), "  "))
+                    sep = ",\n"
+        except BaseException:
+            # don't sit through every queued solve before the error gets reported
+            ex.shutdown(cancel_futures=True)
+            raise
+        finally:
+            # leave valid JSON behind even if a file blew up
+            ofd.write("\n]\n")
 
 
 if __name__ == "__main__":
@@ -3,25 +3,31 @@
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 syn=python
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import fitsio
+from fitshdr import read_header_keys
+from functools import partial
 from glob import glob
 import os
+import re
+from string import Formatter
+from sys import stderr, stdout
 from textwrap import dedent
 
 SCOPE_MAP = {
     # Askar V, 60mm objective
-    "60:270": "a5_60r",
-    "60:360": "a5_60f",
-    "60:446": "a5_60x",
+    (60, 270): "a5_60r",
+    (60, 360): "a5_60f",
+    (60, 446): "a5_60x",
     # Askar V, 80mm objective
-    "80:385": "a5_80r",
-    "80:495": "a5_80f",
-    "80:600": "a5_80x",
+    (80, 385): "a5_80r",
+    (80, 495): "a5_80f",
+    (80, 600): "a5_80x",
     # SVBony SV503, 70mm
-    "70:336": "sv503r",
-    "70:420": "sv503",
+    (70, 336): "sv503r",
+    (70, 420): "sv503",
     # Dwarflab Dwarf II, 20mm f/6
-    "20:100": "dwarf2",
+    (20, 100): "dwarf2",
 }
 
 # Dwarf = 1.45um, 3840x2160 (1920x1080, bin2)
@@ -83,6 +89,18 @@ DELETE_COLS = [
     "YBINNING",
 ]
 
+# Header keys needed to compute each derived output token
+DERIVED_FROM = {
+    "SCOPE": ["APTDIA", "FOCALLEN"],
+    "SITE": ["SITELAT", "SITELONG"],
+    "RADEC": ["RA", "DEC"],
+    "OBJRADEC": ["OBJCTRA", "OBJCTDEC"],
+    "PIXSIZE": ["PIXSIZE1", "PIXSIZE2"],
+    "EXPTIME": ["EXPTIME", "EXP", "EXPOSURE", "XPOSURE"],
+    "BINNING": ["BINNING", "XBINNING", "YBINNING"],
+    "IMGSIZE": ["NAXIS1", "NAXIS2"],
+}
+
 
 def list_tokens():
     msg = """
@@ -133,9 +151,16 @@ def get_args():
 
 
 def rprint(d):
-    for k, v in d.items():
-        print(f"{k:8s} = {v}")
-    print("")
+    stdout.write("".join([f"{k:8s} = {v}\n" for k, v in d.items()]) + "\n")
+
+
+def _format_fields(fmt: str) -> list:
+    "names of the keys a str.format template refers to. Parsing also rejects a malformed template"
+    fields = []
+    for _, name, spec, _ in Formatter().parse(fmt):
+        names = [name] + [n for _, n, _, _ in Formatter().parse(spec or "")]
+        fields.extend(re.split(r"[.\[]", n)[0] for n in names if n)
+    return fields
 
 
 def main():
@@ -147,18 +172,30 @@ def main():
 
     if not args.files:
         args.files = glob(args.glob, root_dir=args.srcdir, recursive=False)
-    for filename in args.files:
+
+    # parse the output format once up front, so a bad format fails before any files are read
+    out_fields = _format_fields(args.outdir)
+
+    # only read the header keys the output format refers to, directly or through a derived
+    # token. Verbose mode shows every key that could be interpolated, so it reads the whole header.
+    if args.verbose:
+        read_header = fitsio.read_header
+    else:
+        wanted = set(out_fields)
+        for k in out_fields:
+            wanted.update(DERIVED_FROM.get(k, []))
+        read_header = partial(read_header_keys, keys=wanted)
+
+    # run the header reads on a thread pool, the per-file open cost dominates here
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        headers = list(ex.map(lambda f: read_header(os.path.join(args.srcdir, f)), args.files))
+
+    for filename, fileheader in zip(args.files, headers):
         # XXX this is lossy
-        fileheader = fitsio.read_header(os.path.join(args.srcdir, filename))
         rdict = {"FILENAME": filename}  # so that FILENAME comes first
-        for x in fileheader.records():
-            # print(x)
-            if x["name"] in SRC_COLUMNS:
-                rdict[x["name"]] = x["value"]
-
         rdict.update(fileheader)
 
-        ix = f"{float(rdict.get('APTDIA',0)):.0f}:{float(rdict.get('FOCALLEN', 0)):.0f}"
+        ix = (round(float(rdict.get("APTDIA", 0))), round(float(rdict.get("FOCALLEN", 0))))
 
         rdict["SCOPE"] = SCOPE_MAP.get(ix, "unknown")
 
@@ -167,7 +204,11 @@ def main():
         except KeyError:
             pass
 
-        rdict["RADEC"] = (rdict["RA"], rdict["DEC"])
+        try:
+            rdict["RADEC"] = (rdict["RA"], rdict["DEC"])
+        except KeyError:
+            pass
+
         try:
             rdict["OBJRADEC"] = (rdict["OBJCTRA"].replace(" ", ":"), rdict["OBJCTDEC"].replace(" ", ":"))
         except KeyError:
@@ -187,11 +228,18 @@ def main():
                 rdict["EXPTIME"] = rdict[f]
                 del rdict[f]
 
-        if rdict.get("BINNING") is None:
-            rdict["BINNING"] = f'{rdict["XBINNING"]}x{rdict["YBINNING"]}'
-        else:
-            rdict["BINNING"] = rdict["BINNING"].replace("*", "x")
-        rdict["IMGSIZE"] = (rdict["NAXIS1"], rdict["NAXIS2"])
+        try:
+            if rdict.get("BINNING") is None:
+                rdict["BINNING"] = f'{rdict["XBINNING"]}x{rdict["YBINNING"]}'
+            else:
+                rdict["BINNING"] = rdict["BINNING"].replace("*", "x")
+        except KeyError:
+            pass
+
+        try:
+            rdict["IMGSIZE"] = (rdict["NAXIS1"], rdict["NAXIS2"])
+        except KeyError:
+            pass
 
         # for k in DELETE_COLS:
         #     try:
@@ -199,20 +247,26 @@ def main():
         #     except KeyError:
         #         pass
 
-        # print(f"output format: {args.outdir}")
-        nf = args.outdir.format(**rdict).replace(" ", "_")
-        # print(nf)
         records.append(rdict)
 
-        if args.verbose:
-            for r in records:
-                rprint(r)
+        # print(f"output format: {args.outdir}")
+        try:
+            nf = args.outdir.format_map(rdict).replace(" ", "_")
+        except KeyError as e:
+            # never build a path from a token that isn't there
+            print(f"{filename}: no {e} in header, skipping", file=stderr)
+            continue
+        # print(nf)
 
         if args.move:
             os.makedirs(nf, exist_ok=True)
             os.rename(filename, os.path.join(nf, filename))
         print(f"os.rename('{filename}', '{nf}/{filename}')")
 
+    if args.verbose:
+        for r in records:
+            rprint(r)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,62 @@
+# coding: utf-8
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 syn=python
+
+"Minimal FITS primary header reader shared by fitsprobe and fitsfilter"
+
+import fitsio
+import re
+
+_RE_CARD_STR = re.compile(r"'((?:[^']|'')*)'")
+
+
+def _card_value(v: str):
+    "decode the value field of a FITS header card"
+    v = v.strip()
+    if v.startswith("'"):
+        m = _RE_CARD_STR.match(v)
+        return m.group(1).replace("''", "'").rstrip() if m else v
+    v = v.split("/", 1)[0].strip()
+    if v in ("T", "F"):
+        return v == "T"
+    if not v:
+        return None
+    try:
+        return int(v)
+    except ValueError:
+        pass
+    try:
+        return float(v.replace("D", "E"))
+    except ValueError:
+        return v
+
+
+def read_header_keys(path: str, keys) -> dict:
+    """
+    Pull just the wanted keys out of the primary header by walking the 2880-byte header
+    blocks directly, rather than having fitsio parse every card. Anything that doesn't
+    look like a plain primary header (compressed, truncated, ...), or that needs a CONTINUE
+    card for a long string, goes through fitsio.
+    """
+    keys = set(keys)
+    rv = {}
+    try:
+        with open(path, "rb") as fd:
+            block = fd.read(2880)
+            if not block.startswith(b"SIMPLE  ="):
+                raise ValueError(path)
+            while len(block) == 2880:
+                for i in range(0, 2880, 80):
+                    card = block[i : i + 80].decode("ascii")
+                    name = card[:8].rstrip()
+                    if name == "END":
+                        return rv
+                    if name in keys and card[8:10] == "= ":
+                        v = _card_value(card[10:])
+                        if isinstance(v, str) and v.endswith("&"):
+                            raise ValueError(path)  # long string continued on later cards
+                        rv[name] = v
+                block = fd.read(2880)
+        raise ValueError(path)  # no END card
+    except ValueError:  # includes UnicodeDecodeError
+        hdr = fitsio.read_header(path)
+        return {k: hdr[k] for k in hdr.keys() if k in keys}
@@ -9,8 +9,11 @@ from fitsio.hdu.image import ImageHDU
 
 from glob import glob
 import re
+from sys import stdout
 from typing import List
 
+_RE_KV = re.compile(r"^(?P<name>[0-9A-Z_-]{,8})[/:=](?P<value>.+?)\s*$")
+
 helptext = """
 Headers one might want to patch with this tool:
 
@@ -116,16 +119,14 @@ def get_args() -> Namespace:
 
 def drprint(d):
     "dictionary record print"
-    for k, v in d.items():
-        print(f"{k:8s} = {v}")
-    print("")
+    stdout.write("".join([f"{k:8s} = {v}\n" for k, v in d.items()]) + "\n")
 
 
 def split_kvpairs(kv) -> list:
     "convert kvpair arg to a list of name and value dicts for header insertion"
     rv = []
     for x in kv:
-        m = re.search("^(?P<name>[0-9A-Z_-]{,8})[/:=](?P<value>.+?)\s*$", x)
+        m = _RE_KV.match(x)
         if m and len(x) <= 81:
             rv.append(m.groupdict())
     return rv
@@ -139,19 +140,19 @@ def main():
 
     args.kvpairs = split_kvpairs(args.kvpair)
 
-    iomode = "rw" if args.update else "r"
     for filename in args.files:
-        with FITS(filename=filename, mode=iomode, trim_strings=True) as fitsfile:
-            image: ImageHDU = fitsfile[0]
-            existing_headers = image.read_header_list()
-            print(f"{filename}:")
-            for kv in args.kvpairs:
-                if args.update:
+        print(f"{filename}:")
+        if args.update:
+            with FITS(filename=filename, mode="rw", trim_strings=True) as fitsfile:
+                image: ImageHDU = fitsfile[0]
+                for kv in args.kvpairs:
                     image.write_key(name=kv["name"], value=kv["value"])
-
+                    print(f"    {kv}")
+        else:
+            # dry run, no need to open the file at all
+            for kv in args.kvpairs:
                 print(f"    {kv}")
-            print()
-            fitsfile.close()
+        print()
 
 
 if __name__ == "__main__":
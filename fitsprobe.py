@@ -3,9 +3,26 @@
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 syn=python
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import fitsio
+from fitshdr import read_header_keys
 import json
+from functools import partial
 from math import nan
+import numpy as np
+import os
+from sys import stdout
+
+try:
+    import orjson
+
+    def _dumps(o) -> str:
+        return orjson.dumps(o, option=orjson.OPT_SORT_KEYS | orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY).decode()
+
+except ImportError:
+
+    def _dumps(o) -> str:
+        return json.dumps(o, sort_keys=True, indent=2, ensure_ascii=False)
 
 
 def get_args():
@@ -21,43 +38,50 @@ def get_args():
 
 
 def rprint(d):
-    for k, v in d.items():
-        print(f"{k:8s} = {v}")
-    print("")
+    stdout.write("".join([f"{k:8s} = {v}\n" for k, v in d.items()]) + "\n")
 
 
 def main():
     args = get_args()
     if args.summary:
         args.column = ["EXPTIME", "CCD-TEMP", "OFFSET", "GAIN", "INSTRUME", "NAXIS", "NAXIS1", "NAXIS2"]
-    accumulator = []
+    averages = np.full(len(args.files), nan)
+    sums = np.full(len(args.files), nan)
     records = []
-    for filename in args.files:
-        fileheader = dict(fitsio.read_header(filename))
+
+    # opening a FITS file has a high fixed cost, so overlap the header reads
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        keys = args.column + [k for k in (args.average, args.sum) if k]
+        read_header = partial(read_header_keys, keys=keys) if args.column else fitsio.read_header
+        headers = list(ex.map(read_header, args.files))
+
+    for i, (filename, fileheader) in enumerate(zip(args.files, headers)):
         rdict = {"FILENAME": filename}  # so that FILENAME comes first
         if args.column:
-            for k in list(fileheader.keys()):
-                if k not in args.column:
-                    del fileheader[k]
-
-        rdict.update(fileheader)
+            rdict.update((k, fileheader[k]) for k in args.column if k in fileheader)
+        else:
+            rdict.update(fileheader)
         records.append(rdict)
-        accumulator.append(rdict.get(args.average, nan))
+        if args.average and args.average in fileheader:
+            averages[i] = fileheader[args.average]
+        if args.sum and args.sum in fileheader:
+            sums[i] = fileheader[args.sum]
 
     if args.verbose or args.summary:
         if args.json:
-            print(json.dumps(records, sort_keys=True, indent=2))
+            print(_dumps(records))
         else:
             for r in records:
                 rprint(r)
 
     if args.average:
-        avg = sum(accumulator) / len(args.files)
+        # nanmean warns when there's nothing to average
+        avg = np.nanmean(averages) if not np.isnan(averages).all() else nan
         print(f"Average {args.average} = {avg:.2f}")
 
     if args.sum:
-        avg = sum(accumulator)
-        print(f"Average {args.sum} = {avg:.2f}")
+        total = np.nansum(sums) if not np.isnan(sums).all() else nan
+        print(f"Sum {args.sum} = {total:.2f}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 syn=python
+
+import pytest
+
+pytest.importorskip("fitsio")
+
+from astroprobe import parse_buf  # noqa: E402
+
+SOLVED = """\
+simplexy: found 1234 sources.
+Field 1: solved with index index-5206-03-littleendian.fits.
+Field center: (RA,Dec) = (83.822, -5.391) deg.
+Field size: 1.53 x 1.02 degrees
+pixel scale 1.83 arcsec/pix.
+Your field contains:
+  IC 434 / NGC 2024 / Horsehead
+  The star Alnitak near IC 432
+The constellation Orion
+"""
+
+
+def test_parse_buf_solved():
+    rv = parse_buf(SOLVED)
+    assert rv["solved"]
+    assert rv["sources"] == 1234
+    assert rv["fov"] == [1.53, 1.02]
+    assert rv["field_center"] == {"ra": 83.822, "dec": -5.391}
+    assert rv["arcsec_pp"] == 1.83
+    assert rv["constellations"] == ["Orion"]
+
+
+def test_parse_buf_several_catalog_hits_per_line():
+    rv = parse_buf(SOLVED)
+    assert rv["ic"] == ["IC 434 / NGC 2024 / Horsehead", "IC 432"]
+    assert rv["ngc"] == ["NGC 2024 / Horsehead"]
+    assert rv["stars"] == ["Alnitak near IC 432"]
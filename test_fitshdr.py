@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# coding: utf-8
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4 syn=python
+
+import pytest
+
+fitsio = pytest.importorskip("fitsio")
+
+from fitshdr import read_header_keys  # noqa: E402
+
+CARDS = [
+    "SIMPLE  =                    T / conforms to FITS standard",
+    "BITPIX  =                    8",
+    "NAXIS   =                    0",
+    "OBJECT  = 'M 42    '           / object name",
+    "TELESCOP= 'it''s a scope'",
+    "CCD-TEMP=              -1.01D1",
+    "EXPTIME =                 30.0",
+    "GAIN    =                  100",
+    "FLAGT   =                    T",
+    "FLAGF   =                    F",
+    "UNDEF   =                      / no value",
+    "LONGSTR = 'abc&'",
+    "CONTINUE  'def'",
+    "COMMENT not a keyword = value",
+]
+KEYS = ["OBJECT", "TELESCOP", "CCD-TEMP", "EXPTIME", "GAIN", "FLAGT", "FLAGF", "UNDEF", "LONGSTR", "MISSING"]
+
+
+def write_fits(path, cards, end=True):
+    b = "".join(c.ljust(80) for c in cards + (["END"] if end else [])).encode("ascii")
+    path.write_bytes(b + b" " * (-len(b) % 2880))
+    return str(path)
+
+
+def expected(path, keys):
+    hdr = fitsio.read_header(path)
+    return {k: hdr[k] for k in hdr.keys() if k in keys}
+
+
+@pytest.mark.parametrize("key", KEYS)
+def test_read_header_keys_matches_fitsio(tmp_path, key):
+    path = write_fits(tmp_path / "a.fits", CARDS)
+    assert read_header_keys(path, [key]) == expected(path, [key])
+
+
+def test_read_header_keys_all(tmp_path):
+    path = write_fits(tmp_path / "a.fits", [c for c in CARDS if "LONGSTR" not in c and "CONTINUE" not in c])
+    assert read_header_keys(path, KEYS) == expected(path, KEYS)
+
+
+def test_read_header_keys_missing_end(tmp_path):
+    path = write_fits(tmp_path / "a.fits", CARDS, end=False)
+    try:
+        want = expected(path, KEYS)
+    except OSError:
+        with pytest.raises(OSError):
+            read_header_keys(path, KEYS)
+    else:
+        assert read_header_keys(path, KEYS) == want